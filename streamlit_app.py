@@ -1,52 +1,55 @@
+import asyncio
+import hashlib
+import html
+import json
+import re
+import threading
+import time
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
-from pygooglenews import GoogleNews
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+from lxml import etree
 import io
 import os
 import openai
+import httpx
+import diskcache
+import xlsxwriter
+from tenacity import retry, retry_if_exception, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 # --- Functions ---
 
-# Function to get the SambaNova client securely
-def get_sambanova_client():
+def create_sambanova_client(sambanova_api_key):
+    """Creates an async SambaNova API client backed by a pooled HTTP/2 connection."""
+    return openai.AsyncOpenAI(
+        base_url="https://api.sambanova.ai/v1",
+        api_key=sambanova_api_key,
+        max_retries=0,  # Retries are handled by create_chat_completion
+        http_client=openai.DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        ),
+    )
+
+
+# Function to get the SambaNova API key securely
+def get_sambanova_api_key():
     """
-    Initializes and returns a SambaNova API client.
+    Returns the SambaNova API key, or None if it is not set.
     
     It fetches the API key from the environment variable 'SAMBANOVA_API_KEY'.
     """
-    sambanova_api_key = "be38bb58-e3a4-422f-8e08-bdbbc6bbdc43"
+    sambanova_api_key = os.environ.get("SAMBANOVA_API_KEY")
     if not sambanova_api_key:
         st.error("SAMBANOVA_API_KEY environment variable is not set. Please set it in your environment.")
         return None
-        
-    client = openai.OpenAI(
-        base_url="https://api.sambanova.ai/v1",
-        api_key=sambanova_api_key,
-    )
-    return client
-
-# --- Prompts ---
-PROMPT_INDIVIDUAL_ANALYSIS = """Carefully analyze the following news article text for information directly indicating potential reasons for client churn specifically for an **employee benefits company in India**. Focus only on details that would impact an employee benefits provider or suggest a company might reduce or discontinue its employee benefits programs.
-
-**Text:**
-{provided_text}
-
-Based on your analysis and using the provided categories below, determine the churn risk and the specific reason(s).
 
-1.  **Risk Level (First Line):** State the risk level as one of the following:
-    * "High Risk"
-    * "Medium Risk"
-    * "Low Risk"
-    * "No Churn Risk Indicated" (If no relevant information is found regarding churn for an employee benefits company)
+    return sambanova_api_key
 
-2.  **Reason(s) for Risk (Second Line):** If a risk is indicated, explain the major reason(s) concisely, referencing the relevant category (e.g., "Reason: [Category Name] - Brief explanation."). If there are multiple relevant reasons, list them clearly.
 
-3.  **2-Line Summary of Analysis (Third and Fourth Lines):** Provide a brief, overall summary of the article's relevance to churn for an employee benefits company, condensing the key findings into exactly two lines. If no churn risk is indicated, summarize why the article is not relevant.
-
-**Categories for Reasons:**
-I. Corporate Restructuring (Mergers, Acquisitions, Joint Ventures, IPO, Entity Realignment, Rebranding, Consolidation, Subsidiary changes)
+# --- Prompts ---
+CHURN_REASON_CATEGORIES = """I. Corporate Restructuring (Mergers, Acquisitions, Joint Ventures, IPO, Entity Realignment, Rebranding, Consolidation, Subsidiary changes)
 II. Business Discontinuity (Closures, Market Exits, Bankruptcy, Operational Suspensions, Business Model Pivots)
 III. Strategic Policy Changes (Benefits Strategy Transformation, Leadership Changes impacting strategy, Cost Optimization related to benefits, Changes in top leadership impacting benefits)
 IV. Financial Constraints (Cash Flow Issues, Cost-Cutting impacting benefits, Budget Reallocation away from benefits, Severe financial loss)
@@ -55,18 +58,35 @@ VI. Regulatory & Compliance Factors (India Specific: Changes in tax policy, GST,
 VII. Competitive Market Dynamics (Client switched vendor, New platform adoption by client, Competitor activity in benefits space, Pricing pressures on benefits, Market share shifts impacting client's ability to offer benefits, Disruption in client's industry affecting benefits, Client's value proposition change impacting benefits)
 VIII. Technological Transitions (Digital transformation affecting benefits administration, HRMS integration impacting benefits systems, API changes relevant to benefits platforms, Analytics adoption impacting benefits, Mobile app for benefits, Platform upgrade for benefits management)
 IX. Service Delivery Issues (Onboarding delay with benefits provider, Tech issues with benefits platform, Merchant issue impacting benefits, Support problem with benefits services, Delivery delay of benefits, Reimbursement issue with benefits claims)
-X. Employee Engagement (Low adoption of benefits programs, Poor user experience with benefits platform, Negative employee feedback on benefits, Generation gap affecting benefits appeal, Hybrid work models impacting benefits usage, Usage drop in benefits offerings)
+X. Employee Engagement (Low adoption of benefits programs, Poor user experience with benefits platform, Negative employee feedback on benefits, Generation gap affecting benefits appeal, Hybrid work models impacting benefits usage, Usage drop in benefits offerings)"""
+
+# Instructions shared by every analysis call; identical across calls so providers can cache the prefix
+SYSTEM_PROMPT = """You analyze news articles for information directly indicating potential reasons for client churn specifically for an **employee benefits company in India**. Focus only on details that would impact an employee benefits provider or suggest a company might reduce or discontinue its employee benefits programs.
 
-**Example Output Format (for High/Medium/Low Risk):**
-High Risk
-Reason: Business Discontinuity - Company announced complete shutdown impacting all operations including benefits.
-Summary: The company is facing imminent closure, directly impacting its ability to retain any employee benefits plans. This represents a critical churn event for any associated benefits provider.
+For each article, determine:
+* "risk": one of "High Risk", "Medium Risk", "Low Risk" or "No Churn Risk Indicated" (if no relevant information is found regarding churn for an employee benefits company)
+* "reason": if a risk is indicated, the major reason(s) referencing the relevant category below (e.g., "[Category Name] - Brief explanation."); otherwise an empty string
+* "summary": a brief, two-sentence summary of the article's relevance to churn for an employee benefits company. If no churn risk is indicated, summarize why the article is not relevant.
 
-**Example Output Format (for No Risk):
-No Churn Risk Indicated
-Summary: The article discusses general market trends not specific to the company's operational or financial health. It provides no indication of changes relevant to employee benefits or potential churn.
+**Categories for Reasons:**
+""" + CHURN_REASON_CATEGORIES + """
+
+Respond with only a JSON object. For a single article:
+{"risk": "High Risk", "reason": "Business Discontinuity - Company announced complete shutdown impacting all operations including benefits.", "summary": "The company is facing imminent closure, directly impacting its ability to retain any employee benefits plans. This represents a critical churn event for any associated benefits provider."}
+For numbered articles, analyze every article independently and return one entry per article, where "id" is the article number:
+{"analyses": [{"id": 1, "risk": "...", "reason": "...", "summary": "..."}]}
 """
 
+USER_PROMPT_TMPL = """Text:
+{provided_text}
+
+Return JSON with keys risk, reason, summary."""
+
+BATCH_USER_PROMPT_TMPL = """Articles:
+{provided_text}
+
+Return JSON with key "analyses" holding one object per article with keys id, risk, reason, summary."""
+
 PROMPT_COMBINED_ANALYSIS = """Given the individual analyses of news articles related to a company and potential client churn, provide an overall summary (at most 4 lines).
 
 **Individual Article Analyses:**
@@ -75,140 +95,689 @@ PROMPT_COMBINED_ANALYSIS = """Given the individual analyses of news articles rel
 In the first line, state the overall risk level for churn for the company (e.g., "Overall High Risk," "Overall Medium Risk," "Overall Low Risk," "Overall No Churn Risk Indicated"). In the subsequent lines, summarize the major reasons for this overall risk, drawing from the categories mentioned in the individual analyses. Be concise and focus on the most impactful reasons across all articles. If no relevant information is found across all articles, state "Overall No Churn Risk Indicated."
 """
 
+# --- DEFAULT CHURN KEYWORDS ---
+DEFAULT_CHURN_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "Corporate Restructuring": (
+        "merger", "acquisition", "investment", "joint venture", "IPO", "restructuring",
+        "realignment", "rebranding", "subsidiary", "consolidation"
+    ),
+    "Business Discontinuity": (
+        "shutdown", "closed", "bankruptcy", "insolvency", "pivot", "market exit"
+    ),
+    "Strategic Policy Changes": (
+        "benefits withdrawn", "benefits discontinued", "centralization",
+        "new CEO", "cost cutting", "budget cuts", "strategy shift"
+    ),
+    "Financial Constraints": (
+        "payroll issue", "financial loss", "cost pressure", "cash flow", "budget reallocation"
+    ),
+    "Employment Structure Changes": (
+        "employee transfer", "contractual workforce", "remote work",
+        "layoffs", "furloughs", "downsizing"
+    ),
+    "Regulatory & Compliance": (
+        "tax policy", "labor law", "income tax", "GST change", "budget amendment", "social security"
+    ),
+    "Competitive Market Dynamics": (
+        "switched vendor", "new platform", "competitor", "pricing", "market share",
+        "disruption", "value proposition"
+    ),
+    "Technological Transitions": (
+        "digital transformation", "HRMS integration", "API", "analytics",
+        "mobile app", "platform upgrade"
+    ),
+    "Service Delivery Issues": (
+        "onboarding delay", "tech issues", "merchant issue", "support problem",
+        "delivery delay", "reimbursement issue"
+    ),
+    "Employee Engagement": (
+        "low adoption", "user experience", "employee feedback",
+        "generation gap", "hybrid work", "usage drop"
+    )
+}
+
+# All default keywords, flattened once for building queries and the keyword filter
+ALL_KEYWORDS = tuple(
+    keyword for category_keywords in DEFAULT_CHURN_KEYWORDS.values() for keyword in category_keywords)
+
+
+def get_keyword_stem(keyword):
+    """Drops a trailing plural "s" (but not "ss") so the keyword also matches its singular form."""
+    if keyword.lower().endswith("s") and not keyword.lower().endswith("ss"):
+        return keyword[:-1]
+    return keyword
+
+
+def compile_keyword_pattern(keywords):
+    """
+    Compiles a case-insensitive regex matching any of the keywords as a whole word or phrase,
+    optionally inflected ("mergers", "layoff", "furloughed"). The boundaries are lookarounds
+    rather than \\b, so keywords starting or ending with a symbol, such as "#layoffs", match too.
+    """
+    stems = [stem for stem in map(get_keyword_stem, keywords) if stem]
+    if not stems:
+        # No keywords to match, so no article passes the filter
+        return re.compile(r"(?!)")
+    return re.compile(
+        r"(?<!\w)(?:" + "|".join(re.escape(stem) for stem in stems) + r")(?:s|es|ed|ing)?(?!\w)",
+        re.IGNORECASE)
+
+
+# Articles whose text matches none of the churn keywords are not sent to the LLM
+CHURN_RE = compile_keyword_pattern(ALL_KEYWORDS)
+
+GOOGLE_NEWS_RSS_URL = "https://news.google.com/rss/search"
+NEWS_FETCH_TIMEOUT_SECONDS = 20
+
+# Maximum number of Google News requests in flight at once across all companies
+MAX_INFLIGHT_NEWS_REQUESTS = 8
+NEWS_REQUEST_SEMAPHORE = asyncio.Semaphore(MAX_INFLIGHT_NEWS_REQUESTS)
+
+# Maximum number of SambaNova requests in flight at once across all companies
+MAX_INFLIGHT_REQUESTS = 16
+
+ANALYSIS_MODEL = "Meta-Llama-3.3-70B-Instruct"
+# Small model that screens articles first; only the ones it flags are re-analyzed by ANALYSIS_MODEL
+SCREENING_MODEL = "Meta-Llama-3.1-8B-Instruct"
+
+# SambaNova requests allowed per minute across all sessions sharing the API key
+SAMBANOVA_REQUESTS_PER_MINUTE = 60
+
+# Bulk mode submits all article prompts as one Batch API job and polls it until it finishes
+BATCH_POLL_INTERVAL_SECONDS = 60
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Streamed output is redrawn at most this often, rather than once per token
+STREAM_REDRAW_INTERVAL_SECONDS = 0.1
+
+# On-disk cache of analyses, kept for 7 days across app restarts
+ANALYSIS_CACHE_DIR = "./.churn_cache"
+ANALYSIS_CACHE_EXPIRY_SECONDS = 7 * 24 * 60 * 60
+
+# Submitted bulk jobs are recorded until collected, so an interrupted run can resume them
+BULK_JOBS_CACHE_DIR = os.path.join(ANALYSIS_CACHE_DIR, "bulk_jobs")
+BULK_JOB_EXPIRY_SECONDS = 48 * 60 * 60
+
+
 # Cache results for 1 hour to avoid repeated API calls
-@st.cache_data(ttl=3600)
-def analyze_text(company_name, provided_text, prompt_template, _sambanova_client):
-    """Analyzes the provided text for churn indicators using SambaNova AI."""
+@st.cache_resource(ttl=3600)
+def get_analysis_cache():
+    """Returns the in-process dict of analyses keyed by prompt hash, shared across reruns."""
+    return {}
+
+
+@st.cache_resource
+def get_disk_cache():
+    """Returns the on-disk analysis cache, consulted when the in-process cache misses."""
+    return diskcache.Cache(ANALYSIS_CACHE_DIR)
+
+
+@st.cache_resource
+def get_bulk_job_store():
+    """Returns the on-disk record of submitted bulk jobs, mapping each batch id to its prompt ids."""
+    return diskcache.Cache(BULK_JOBS_CACHE_DIR)
+
+
+def get_analysis_cache_key(prompt, model=ANALYSIS_MODEL, system_prompt=""):
+    """Returns the key under which the analysis of a prompt by a model is cached."""
+    return hashlib.sha256((system_prompt + prompt + model).encode()).hexdigest()
+
+
+def get_cached_analysis(cache_key):
+    """Looks up an analysis in the in-process cache, then on disk. Returns None on a miss."""
+    analysis_cache = get_analysis_cache()
+    if cache_key in analysis_cache:
+        return analysis_cache[cache_key]
+    output = get_disk_cache().get(cache_key)
+    if output is not None:
+        analysis_cache[cache_key] = output
+    return output
+
+
+def cache_analysis(cache_key, output):
+    """Stores an analysis in both the in-process and the on-disk cache."""
+    get_analysis_cache()[cache_key] = output
+    get_disk_cache().set(cache_key, output, expire=ANALYSIS_CACHE_EXPIRY_SECONDS)
+
+
+@st.cache_resource
+def get_rate_limit_state():
+    """
+    Returns the SambaNova rate limit state shared by every session in the process.
+    Each session runs its own event loop, so the state is guarded by a thread lock.
+    """
+    return {"lock": threading.Lock(), "next_slot": 0.0}
+
+
+async def wait_for_rate_limit():
+    """
+    Waits until one more SambaNova request fits within SAMBANOVA_REQUESTS_PER_MINUTE.
+    Every request moves the schedule one slot forward; up to a minute's worth of requests
+    can go out at once, after which each waits for its slot.
+    """
+    rate_limit_state = get_rate_limit_state()
+    slot_seconds = 60 / SAMBANOVA_REQUESTS_PER_MINUTE
+    with rate_limit_state["lock"]:
+        now = time.monotonic()
+        rate_limit_state["next_slot"] = max(rate_limit_state["next_slot"], now) + slot_seconds
+        delay = rate_limit_state["next_slot"] - now - 60
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type(
+        (openai.RateLimitError, openai.APITimeoutError, openai.InternalServerError)),
+    reraise=True,
+)
+async def create_chat_completion(sambanova_client, **kwargs):
+    """
+    Creates a chat completion within the SambaNova rate limit.
+    Rate-limit errors, timeouts and 5xx errors are retried with exponential backoff and jitter.
+    """
+    await wait_for_rate_limit()
+    return await sambanova_client.chat.completions.create(**kwargs)
+
+
+async def aanalyze_text(company_name, provided_text, prompt_template, sambanova_client, response_format=None, placeholder=None, model=ANALYSIS_MODEL, system_prompt=None, validate=None):
+    """
+    Analyzes the provided text for churn indicators using SambaNova AI.
+    The response is streamed; if a placeholder is given, partial output is shown in it as it arrives,
+    redrawn at most every STREAM_REDRAW_INTERVAL_SECONDS; JSON output is shown as a code block.
+    If a validate function is given, output it rejects is neither cached nor served from the cache.
+    """
     prompt = prompt_template.format(
         company_name=company_name, provided_text=provided_text)
+    cache_key = get_analysis_cache_key(prompt, model, system_prompt or "")
+    output = get_cached_analysis(cache_key)
+    if output is not None and (validate is None or validate(output)):
+        return output
+    messages = [{"role": "user", "content": prompt}]
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
     try:
-        response = _sambanova_client.chat.completions.create(
-            model="Meta-Llama-3.3-70B-Instruct",
-            messages=[{"role": "user", "content": prompt}],
-            stream=False,
+        response = await create_chat_completion(
+            sambanova_client,
+            model=model,
+            messages=messages,
+            stream=True,
+            response_format=response_format or openai.NOT_GIVEN,
         )
-        output = response.choices[0].message.content
-        return output if output else f"Unexpected response: {output}"
+        output_parts = []
+        last_redraw = time.monotonic()
+
+        def draw(text):
+            # JSON responses are shown as a code block rather than rendered as markdown
+            if response_format is None:
+                placeholder.markdown(text)
+            else:
+                placeholder.code(text, language="json")
+
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            output_parts.append(chunk.choices[0].delta.content or "")
+            if placeholder is not None and time.monotonic() - last_redraw >= STREAM_REDRAW_INTERVAL_SECONDS:
+                draw("".join(output_parts))
+                last_redraw = time.monotonic()
+        output = "".join(output_parts)
+        if placeholder is not None:
+            draw(output)
     except Exception as e:
         st.error(f"Error querying SambaNova AI for {company_name}: {e}")
         return "Analysis failed due to AI service error."
+    if not output:
+        return f"Unexpected response: {output}"
+    if validate is None or validate(output):
+        cache_analysis(cache_key, output)
+    return output
+
+
+def normalize_url(url):
+    """Drops utm_* tracking parameters and the fragment so variants of one URL compare equal."""
+    parsed_url = urlparse(url)
+    query = urlencode([(key, value) for key, value in parse_qsl(parsed_url.query, keep_blank_values=True)
+                       if not key.lower().startswith("utm_")])
+    return urlunparse(parsed_url._replace(query=query, fragment=""))
+
+
+def _is_allowed_host(host, allowed_domains):
+    """Checks whether host is one of the allowed domains or a subdomain of one."""
+    labels = host.split('.')
+    return any('.'.join(labels[i:]) in allowed_domains for i in range(len(labels) - 1))
+
+
+def create_news_client():
+    """Creates an HTTP/2 client for Google News, so concurrent searches share one connection."""
+    return httpx.AsyncClient(http2=True, timeout=NEWS_FETCH_TIMEOUT_SECONDS)
 
 
-@st.cache_data(ttl=3600)  # Cache news fetching for 1 hour
-def fetch_news(company_name, from_date, to_date, max_articles=10, queries=None, allowed_domains=None):
+def is_retryable_news_error(exc):
+    """Checks whether a Google News request failed on a network error, a 429 or a 5xx response."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def _parse_news_item(item):
+    """Converts an RSS <item> element into a dict with feedparser's entry keys."""
+    source = item.find("source")
+    return {
+        "title": item.findtext("title"),
+        "link": item.findtext("link"),
+        "summary": item.findtext("description"),
+        "published": item.findtext("pubDate"),
+        "source": {"href": source.get("url", ""), "title": source.text} if source is not None else {},
+    }
+
+
+def parse_news_feed(rss_bytes):
+    """Parses a Google News RSS feed with lxml, returning its items under 'entries'."""
+    root = etree.fromstring(rss_bytes)
+    return {"entries": [_parse_news_item(item) for item in root.iter("item")]}
+
+
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(4),
+    retry=retry_if_exception(is_retryable_news_error),
+    reraise=True,
+)
+async def search_news(news_client, query, from_date_str, to_date_str):
+    """
+    Fetches and parses the Google News RSS search feed for a query within a date range.
+    Network errors, 429s and 5xx responses are retried with exponential backoff.
+    """
+    async with NEWS_REQUEST_SEMAPHORE:
+        response = await news_client.get(GOOGLE_NEWS_RSS_URL, params={
+            "q": f"{query} after:{from_date_str} before:{to_date_str}",
+            "hl": "en-IN",
+            "gl": "IN",
+            "ceid": "IN:en",
+        })
+    response.raise_for_status()
+    return parse_news_feed(response.content)
+
+
+def _filter_entries(entries, allowed_domains, max_articles):
     """
-    Fetches news articles for a given company using the pygooglenews library.
-    Filters articles by allowed domains.
+    Keeps entries whose source is one of the allowed domains, capped at max_articles.
+    allowed_domains is a frozenset of lowercase domains without a 'www.' prefix.
+    Falls back to the top entry if none of them is from an allowed domain.
+    """
+    if not allowed_domains:
+        return entries[:max_articles]
+    filtered_entries = []
+    # Many entries share a source, so parse each source link only once
+    host_by_source_link = {}
+    for article in entries:
+        source_link = article.get('source', {}).get('href', '')
+        host = host_by_source_link.get(source_link)
+        if host is None:
+            host = urlparse(source_link).netloc.lower().removeprefix('www.')
+            host_by_source_link[source_link] = host
+        if _is_allowed_host(host, allowed_domains):
+            filtered_entries.append(article)
+    # If no articles from allowed domains, add the top article as a fallback
+    if not filtered_entries and entries:
+        filtered_entries.append(entries[0])
+    return filtered_entries[:max_articles]
+
+
+# Cache news fetching for 1 hour
+@st.cache_resource(ttl=3600)
+def get_news_cache():
+    """Returns the in-process dict of fetched articles, shared across reruns."""
+    return {}
+
+
+async def fetch_news(company_name, from_date, to_date, max_articles=10, queries=None, allowed_domains=None, news_client=None):
+    """
+    Fetches news articles for a given company from the Google News RSS feed.
+    All queries are requested concurrently. Filters articles by allowed domains
+    and drops articles already returned by an earlier query.
     """
-    gn = GoogleNews(lang='en', country='IN')
     results = []
+    seen_links = set()
     if queries is None:
         queries = [company_name]
 
+    from_date_str = from_date.strftime('%Y-%m-%d')
+    to_date_str = to_date.strftime('%Y-%m-%d')
+    cache_key = (tuple(queries), from_date_str, to_date_str, max_articles, allowed_domains)
+    news_cache = get_news_cache()
+    if cache_key in news_cache:
+        return news_cache[cache_key]
+
+    owns_news_client = news_client is None
+    if owns_news_client:
+        news_client = create_news_client()
     try:
-        # Process queries in groups of 3 to optimize API calls
-        for i in range(0, len(queries), 3):
-            group_queries = queries[i:i+3]
-            combined_query = " OR ".join(group_queries)
-            from_date_str = from_date.strftime('%Y-%m-%d')
-            to_date_str = to_date.strftime('%Y-%m-%d')
-            search_results = gn.search(
-                combined_query, from_=from_date_str, to_=to_date_str)
-
-            if search_results and 'entries' in search_results:
-                articles_for_query = []
-                if allowed_domains:
-                    for article in search_results['entries']:
-                        source_link = article.get('source', {}).get('href', '')
-                        parsed_uri = urlparse(source_link)
-                        domain = parsed_uri.netloc.replace('www.', '')
-                        if any(d in domain for d in allowed_domains):
-                            articles_for_query.append(article)
-                    # If no articles from allowed domains, add the top article as a fallback
-                    if not articles_for_query and search_results['entries']:
-                        articles_for_query.append(search_results['entries'][0])
-                else:
-                    articles_for_query = search_results['entries']
-
-                results.extend(articles_for_query[:max_articles])
+        # gather returns results in query order, keeping the article ranking stable
+        search_results_list = await asyncio.gather(
+            *(search_news(news_client, query, from_date_str, to_date_str) for query in queries))
+        for query, search_results in zip(queries, search_results_list):
+            if search_results['entries']:
+                for article in _filter_entries(search_results['entries'], allowed_domains, max_articles):
+                    link = article.get('link')
+                    if not link:
+                        continue
+                    link = normalize_url(link)
+                    if link not in seen_links:
+                        seen_links.add(link)
+                        results.append(article)
             else:
                 st.warning(
-                    f"No results or 'entries' not found for query '{combined_query}'")
+                    f"No results found for query '{query}'")
     except Exception as e:
         st.error(f"Error fetching news for {company_name}: {e}")
         return None
+    finally:
+        if owns_news_client:
+            await news_client.aclose()
     # Ensure total articles returned is at most max_articles
-    return results[:max_articles]
+    news_cache[cache_key] = results[:max_articles]
+    return news_cache[cache_key]
+
+
+def chunk_keywords(keywords, max_query_len=200):
+    """
+    Splits keywords into lists whose OR-joined clause stays within max_query_len characters.
+    Multi-word keywords are quoted so Google News matches them as phrases.
+    """
+    chunks = []
+    current_chunk = []
+    current_len = 0
+    for keyword in keywords:
+        term = f'"{keyword}"' if " " in keyword else keyword
+        added_len = len(term) + (len(" OR ") if current_chunk else 0)
+        if current_chunk and current_len + added_len > max_query_len:
+            chunks.append(current_chunk)
+            current_chunk = []
+            current_len = 0
+            added_len = len(term)
+        current_chunk.append(term)
+        current_len += added_len
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+def format_analysis(analysis_record):
+    """Renders a JSON analysis record as lines: risk level, 'Reason: ...', 'Summary: ...'."""
+    lines = [analysis_record.get("risk") or "Unknown Risk"]
+    reason = analysis_record.get("reason")
+    if reason:
+        lines.append(reason if reason.startswith("Reason:") else f"Reason: {reason}")
+    summary = analysis_record.get("summary")
+    if summary:
+        lines.append(summary if summary.startswith("Summary:") else f"Summary: {summary}")
+    return "\n".join(lines)
+
+
+def load_analysis_record(output):
+    """Returns the JSON analysis record returned for a single article, or None if output is not one."""
+    try:
+        analysis_record = json.loads(output)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(analysis_record, dict) or "risk" not in analysis_record:
+        return None
+    return analysis_record
+
+
+def parse_analysis(output):
+    """
+    Parses the JSON returned for a single article into its analysis text.
+    Output that is not a JSON analysis, such as an error message, is returned unchanged.
+    """
+    analysis_record = load_analysis_record(output)
+    if analysis_record is None:
+        return output
+    return format_analysis(analysis_record)
+
+
+def parse_batch_analysis(batch_output, article_count):
+    """
+    Parses the JSON returned for BATCH_USER_PROMPT_TMPL into one analysis text per article.
+    Returns None if the output is not valid JSON or any article is missing from it.
+    """
+    try:
+        records = json.loads(batch_output)
+        if isinstance(records, dict):
+            records = records["analyses"]
+        analyses_by_id = {int(record["id"]): format_analysis(record) for record in records}
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+        return None
+    article_ids = range(1, article_count + 1)
+    if any(article_id not in analyses_by_id for article_id in article_ids):
+        return None
+    return [analyses_by_id[article_id] for article_id in article_ids]
+
+
+def build_queries(company_name, keyword_chunks):
+    """Builds one compound Google News query per keyword chunk for a company."""
+    return [f'"{company_name}" AND ({" OR ".join(chunk)})'
+            for chunk in keyword_chunks] or [company_name]
+
+
+# Longest article text sent for analysis, which bounds the input tokens per article
+MAX_ARTICLE_CHARS = 800
+_TAG_RE = re.compile(r"<[^>]+>")
 
 
 def process_article(article):
-    """Extracts summary or title from a news article."""
-    return article.get('summary') or article.get('title') or ""
+    """
+    Extracts summary or title from a news article as plain text, with HTML tags
+    and entities removed, whitespace collapsed and at most MAX_ARTICLE_CHARS characters.
+    """
+    article_text = article.get('summary') or article.get('title') or ""
+    article_text = html.unescape(_TAG_RE.sub(" ", article_text))
+    return " ".join(article_text.split())[:MAX_ARTICLE_CHARS]
+
+
+def collect_individual_analyses(company_name, all_articles, article_texts, analysis_results, keyword_pattern=CHURN_RE):
+    """
+    Pairs each article with its analysis. analysis_results holds, in order, the results for the
+    articles whose text matches keyword_pattern; the other articles get a fixed rating.
+    Returns the analyses and their concatenation for PROMPT_COMBINED_ANALYSIS.
+    """
+    # Results are in the order of articles with text
+    analysis_results = iter(analysis_results)
+    # Filled by article index so results can be assigned in any order
+    individual_analyses_list = [None] * len(all_articles)
+    combined_analysis_parts = []
+
+    for i, article in enumerate(all_articles):
+        article_text = article_texts[i]
+        article_url = article.get('link') or 'No URL available'
+        # Get actual title or fallback
+        article_title = article.get('title') or f"Article {i+1}"
+
+        if article_text and keyword_pattern.search(article_text):
+            analysis_result = next(analysis_results)
+            if isinstance(analysis_result, Exception):
+                st.error(f"Error analyzing article for {company_name}: {analysis_result}")
+                analysis_result = "Analysis failed due to AI service error."
+        elif article_text:
+            analysis_result = "No Churn Risk Indicated (No churn keywords in article summary/title)."
+        else:
+            analysis_result = "No Churn Risk Indicated (No text in article summary/title)."
+        individual_analyses_list[i] = {
+            "title": article_title,  # Store the title even if no text
+            "url": article_url,
+            "analysis": analysis_result
+        }
+        combined_analysis_parts.append(f"Article {i+1} Analysis:\n{analysis_result}")
+
+    return individual_analyses_list, "\n\n".join(combined_analysis_parts)
+
+
+async def summarize_analyses(company_name, individual_analyses_list, combined_analysis_text_for_model, sambanova_client, semaphore):
+    """
+    Produces the overall churn risk summary for a company from its article analyses.
+    The summary is aggregated locally; the LLM is only asked to combine the analyses
+    when high-risk articles point to different reason categories.
+    """
+    if not individual_analyses_list:
+        return "Overall No Churn Risk Indicated."
+
+    high_risk_categories = {
+        get_reason_category(reason)
+        for article_analysis in individual_analyses_list
+        if get_risk_level(article_analysis["analysis"]) == "High Risk"
+        and (reason := get_reason(article_analysis["analysis"]))
+    }
+    if len(high_risk_categories) < 2:
+        return aggregate_overall_summary(individual_analyses_list)
+
+    combined_prompt = PROMPT_COMBINED_ANALYSIS.format(
+        individual_analyses_summary=combined_analysis_text_for_model)
+    async with semaphore:
+        return await aanalyze_text(
+            company_name, combined_prompt, "{provided_text}", sambanova_client)
 
 
-def analyze_news(company_name, from_date, to_date, max_articles=10, queries=None, allowed_domains=None, sambanova_client=None):
+async def analyze_articles_batch(company_name, article_texts, sambanova_client, semaphore, model, placeholder=None):
+    """
+    Analyzes all article texts in a single call to the given model, so the instructions are
+    sent once. Returns one analysis text per article, or None if the response could not be parsed.
+    """
+    numbered_articles = "\n\n".join(
+        f"[ARTICLE {i}]\n{article_text}" for i, article_text in enumerate(article_texts, 1))
+    async with semaphore:
+        batch_output = await aanalyze_text(
+            company_name, numbered_articles, BATCH_USER_PROMPT_TMPL, sambanova_client,
+            response_format={"type": "json_object"}, placeholder=placeholder,
+            model=model, system_prompt=SYSTEM_PROMPT,
+            validate=lambda output: parse_batch_analysis(output, len(article_texts)) is not None)
+    return parse_batch_analysis(batch_output, len(article_texts))
+
+
+async def analyze_news(company_name, from_date, to_date, max_articles=10, queries=None, allowed_domains=None, sambanova_client=None, semaphore=None, placeholder=None, keyword_pattern=CHURN_RE, news_client=None):
     """
     Fetches news articles for a company and analyzes them for churn indicators.
+    Articles whose text does not match keyword_pattern are rated without an LLM call;
+    the rest are screened by SCREENING_MODEL and, if flagged, analyzed by ANALYSIS_MODEL.
+    Articles are analyzed concurrently; the semaphore bounds the requests in flight.
+    The batched analysis streams into the placeholder, if one is given.
     """
     if not sambanova_client:
         return {"individual_analyses": [], "overall_summary": "API client is not available."}
-        
-    st.subheader(f"Analyzing News for **{company_name}**")
-    all_articles = fetch_news(company_name, from_date,
-                             to_date, max_articles, queries, allowed_domains)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+
+    all_articles = await fetch_news(company_name, from_date,
+                                    to_date, max_articles, queries, allowed_domains, news_client)
 
     if not all_articles:
         return {"individual_analyses": [], "overall_summary": "No relevant news articles found for analysis."}
 
-    individual_analyses_list = []
-    combined_analysis_text_for_model = ""
+    async def analyze_article_text(article_text):
+        async with semaphore:
+            output = await aanalyze_text(
+                company_name, article_text, USER_PROMPT_TMPL, sambanova_client,
+                response_format={"type": "json_object"}, system_prompt=SYSTEM_PROMPT,
+                validate=lambda output: load_analysis_record(output) is not None)
+        return parse_analysis(output)
+
+    article_texts = [process_article(article) for article in all_articles]
+    texts_to_analyze = [article_text for article_text in article_texts
+                        if article_text and keyword_pattern.search(article_text)]
+
+    # The small model screens every article; the large one only re-analyzes the flagged ones
+    analysis_results = [None] * len(texts_to_analyze)
+    flagged_indices = list(range(len(texts_to_analyze)))
+    if texts_to_analyze:
+        screening_results = await analyze_articles_batch(
+            company_name, texts_to_analyze, sambanova_client, semaphore, SCREENING_MODEL)
+        if screening_results is not None:
+            analysis_results = screening_results
+            flagged_indices = [i for i, screening_result in enumerate(screening_results)
+                               if get_risk_level(screening_result) != "No Churn Risk Indicated"]
+
+    flagged_texts = [texts_to_analyze[i] for i in flagged_indices]
+    if flagged_texts:
+        flagged_results = await analyze_articles_batch(
+            company_name, flagged_texts, sambanova_client, semaphore, ANALYSIS_MODEL, placeholder)
+        if flagged_results is None:
+            # Fall back to one call per article if the batch response could not be parsed
+            tasks = [analyze_article_text(article_text) for article_text in flagged_texts]
+            flagged_results = await asyncio.gather(*tasks, return_exceptions=True)
+        for i, flagged_result in zip(flagged_indices, flagged_results):
+            analysis_results[i] = flagged_result
+    individual_analyses_list, combined_analysis_text_for_model = collect_individual_analyses(
+        company_name, all_articles, article_texts, analysis_results, keyword_pattern)
+    overall_summary_result = await summarize_analyses(
+        company_name, individual_analyses_list, combined_analysis_text_for_model, sambanova_client, semaphore)
 
-    for i, article in enumerate(all_articles):
-        article_text = process_article(article)
-        article_url = article.get('link', 'No URL available')
-        # Get actual title or fallback
-        article_title = article.get('title', f"Article {i+1}")
-
-        if article_text:
-            analysis_result = analyze_text(
-                company_name, article_text, PROMPT_INDIVIDUAL_ANALYSIS, sambanova_client)
-            individual_analyses_list.append({
-                "title": article_title,  # Store the title
-                "url": article_url,
-                "analysis": analysis_result
-            })
-            combined_analysis_text_for_model += f"Article {i+1} Analysis:\n{analysis_result}\n\n"
-        else:
-            no_text_analysis = "No Churn Risk Indicated (No text in article summary/title)."
-            individual_analyses_list.append({
-                "title": article_title,  # Store the title even if no text
-                "url": article_url,
-                "analysis": no_text_analysis
-            })
-            combined_analysis_text_for_model += f"Article {i+1} Analysis:\n{no_text_analysis}\n\n"
+    return {"individual_analyses": individual_analyses_list, "overall_summary": overall_summary_result}
 
-    overall_summary_result = "Overall No Churn Risk Indicated."
-    if individual_analyses_list:
-        combined_prompt = PROMPT_COMBINED_ANALYSIS.format(
-            individual_analyses_summary=combined_analysis_text_for_model.strip())
-        overall_summary_result = analyze_text(
-            company_name, combined_prompt, "{provided_text}", sambanova_client)
 
-    return {"individual_analyses": individual_analyses_list, "overall_summary": overall_summary_result}
+# Matches the first risk level mentioned in an analysis
+RISK_RE = re.compile(
+    r"(no churn risk indicated|high risk|medium risk|low risk)", re.IGNORECASE)
+RISK_LEVELS = {
+    "no churn risk indicated": "No Churn Risk Indicated",
+    "high risk": "High Risk",
+    "medium risk": "Medium Risk",
+    "low risk": "Low Risk",
+}
 
 
 def get_risk_level(summary_text):
-    """Extracts risk level from a summary string."""
-    summary_text_lower = summary_text.lower()
-    if "low risk" in summary_text_lower:
-        return "Low Risk"
-    elif "medium risk" in summary_text_lower:
-        return "Medium Risk"
-    elif "high risk" in summary_text_lower:
-        return "High Risk"
-    elif "no churn risk indicated" in summary_text_lower:
-        return "No Churn Risk Indicated"
-    return "Unknown Risk"  # Fallback
+    """Extracts risk level from a summary string, using the first risk level it mentions."""
+    match = RISK_RE.search(summary_text)
+    if not match:
+        return "Unknown Risk"  # Fallback
+    return RISK_LEVELS[match.group(1).lower()]
+
+
+# Ranks risk levels when aggregating; failed analyses rank below "No Churn Risk Indicated"
+RISK_ORDER = {
+    "High Risk": 3,
+    "Medium Risk": 2,
+    "Low Risk": 1,
+    "No Churn Risk Indicated": 0,
+    "Unknown Risk": -1,
+}
+MAX_OVERALL_REASONS = 3
+
+REASON_RE = re.compile(r"^\s*Reason:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+
+
+def get_reason(analysis_text):
+    """Returns the reason given in an analysis, or None if it gives none."""
+    match = REASON_RE.search(analysis_text)
+    return match.group(1).strip() if match else None
+
+
+def get_reason_category(reason):
+    """Returns the category part of a 'Category - explanation' reason."""
+    return reason.split(" - ", 1)[0].strip()
+
+
+def aggregate_overall_summary(individual_analyses_list):
+    """
+    Builds the overall summary without an LLM call: the highest risk level among the
+    articles, followed by up to MAX_OVERALL_REASONS distinct reasons, riskiest first.
+    """
+    ranked_analyses = sorted(
+        (article_analysis["analysis"] for article_analysis in individual_analyses_list),
+        key=lambda analysis: RISK_ORDER[get_risk_level(analysis)], reverse=True)
+    overall_risk_level = get_risk_level(ranked_analyses[0])
+    if RISK_ORDER[overall_risk_level] <= 0:
+        return f"Overall {overall_risk_level}."
+
+    reasons = dict.fromkeys(
+        reason for analysis in ranked_analyses
+        if RISK_ORDER[get_risk_level(analysis)] > 0 and (reason := get_reason(analysis)))
+    top_reasons = list(reasons)[:MAX_OVERALL_REASONS]
+    if not top_reasons:
+        return f"Overall {overall_risk_level}."
+    return f"Overall {overall_risk_level}\nKey drivers: " + "; ".join(top_reasons)
 
 
 def display_summary_with_color(company_name, summary_text):
@@ -228,74 +797,282 @@ def display_summary_with_color(company_name, summary_text):
         st.success(summary_text)
 
 
-def run_analysis(company_names, days_to_search, custom_keyword_string=None):
-    """Main function to orchestrate the news fetching and analysis for multiple companies."""
+# Columns of the exported results: one overall row per company, then one row per article
+EXPORT_COLUMNS = ["Company", "Kind", "Article #", "Title", "URL", "Risk Level", "Analysis"]
+
+
+def build_export_records(analysis_results):
+    """Flattens the analysis results into long-format rows for the Excel export."""
+    rows = []
+    for company, analysis in analysis_results.items():
+        overall_summary = analysis.get(
+            "overall_summary", "No analysis available")
+        rows.append({
+            "Company": company,
+            "Kind": "Overall",
+            "Risk Level": get_risk_level(overall_summary),
+            "Analysis": overall_summary
+        })
+        for i, article_analysis in enumerate(analysis.get("individual_analyses", [])):
+            rows.append({
+                "Company": company,
+                "Kind": "Article",
+                "Article #": i + 1,
+                "Title": article_analysis["title"],
+                "URL": article_analysis["url"],
+                "Risk Level": get_risk_level(article_analysis["analysis"]),
+                "Analysis": article_analysis["analysis"]
+            })
+    return rows
+
+
+def write_results_excel(df_results):
+    """
+    Writes the results to an in-memory .xlsx file, streaming rows with xlsxwriter's
+    constant_memory mode. That mode requires rows to be written in order, which
+    DataFrame.to_excel does not do, so rows are written one at a time here.
+    """
+    excel_buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(excel_buffer, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Results")
+    worksheet.write_row(0, 0, list(df_results.columns))
+    for row_index, row in enumerate(df_results.itertuples(index=False), 1):
+        worksheet.write_row(
+            row_index, 0, [None if pd.isna(value) else value for value in row])
+    workbook.close()
+    excel_buffer.seek(0)
+    return excel_buffer
+
+
+async def analyze_companies(company_names, from_date, to_date, max_articles, keywords, allowed_domains, sambanova_client, status, keyword_pattern=CHURN_RE):
+    """
+    Analyzes all companies concurrently with a shared API client and request limit,
+    reporting progress on the given st.status container.
+    """
+    semaphore = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+    completed = 0
+    # One compound search per keyword chunk instead of one search per keyword
+    keyword_chunks = chunk_keywords(keywords, max_query_len=200)
+
+    async def analyze_company(company, news_client):
+        nonlocal completed
+        queries = build_queries(company, keyword_chunks)
+        # Shows the company's raw JSON analysis while it streams in, as a progress indicator;
+        # it is cleared once the company is done, since the formatted results are shown after the run
+        placeholder = status.empty()
+        company_analysis = await analyze_news(
+            company, from_date, to_date, max_articles, queries, allowed_domains, sambanova_client, semaphore,
+            placeholder, keyword_pattern, news_client
+        )
+        placeholder.empty()
+        completed += 1
+        status.write(f"Finished analyzing **{company}**")
+        status.update(
+            label=f"Analyzed {completed} of {len(company_names)} companies...")
+        return company_analysis
+
+    async with create_news_client() as news_client:
+        company_tasks = [analyze_company(company, news_client) for company in company_names]
+        company_analyses = await asyncio.gather(*company_tasks, return_exceptions=True)
+
     results = {}
+    for company, company_analysis in zip(company_names, company_analyses):
+        if isinstance(company_analysis, Exception):
+            st.error(f"Error analyzing {company}: {company_analysis}")
+            company_analysis = None
+        results[company] = company_analysis if company_analysis else {
+            "overall_summary": "Analysis failed."}
+    return results
+
+
+async def submit_batch_job(prompts_by_id, sambanova_client):
+    """
+    Submits the prompts as one OpenAI-compatible Batch API job and records it in the bulk
+    job store, so a later run can collect it if this one is interrupted. Returns the batch id.
+    """
+    batch_lines = [
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": ANALYSIS_MODEL,
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                "response_format": {"type": "json_object"},
+            },
+        })
+        for custom_id, prompt in prompts_by_id.items()
+    ]
+    batch_input_file = await sambanova_client.files.create(
+        file=("churn_analysis_batch.jsonl", "\n".join(batch_lines).encode()), purpose="batch")
+    batch = await sambanova_client.batches.create(
+        input_file_id=batch_input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    get_bulk_job_store().set(batch.id, list(prompts_by_id), expire=BULK_JOB_EXPIRY_SECONDS)
+    return batch.id
+
+
+async def collect_batch_job(batch_id, sambanova_client, status):
+    """
+    Waits for a Batch API job to finish and caches the output of each request that succeeded,
+    under its prompt id. The job's record is dropped once its results have been collected.
+    """
+    try:
+        batch = await sambanova_client.batches.retrieve(batch_id)
+    except openai.NotFoundError:
+        get_bulk_job_store().delete(batch_id)
+        raise
+    while batch.status not in BATCH_FINAL_STATUSES:
+        status.update(label=f"Bulk job {batch.id} is {batch.status}... If interrupted, start the analysis again to resume it.")
+        await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+        batch = await sambanova_client.batches.retrieve(batch.id)
+    if batch.status != "completed" or not batch.output_file_id:
+        get_bulk_job_store().delete(batch.id)
+        raise RuntimeError(f"Bulk job {batch.id} ended with status '{batch.status}'.")
+
+    batch_output = await sambanova_client.files.content(batch.output_file_id)
+    for line in batch_output.text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") == 200:
+            output = response["body"]["choices"][0]["message"]["content"]
+            if output and load_analysis_record(output) is not None:
+                cache_analysis(result["custom_id"], output)
+    get_bulk_job_store().delete(batch.id)
+
+
+async def submit_bulk_prompts(prompts_by_id, sambanova_client, status):
+    """Submits the prompts, if any, as a bulk job. Returns the list of submitted batch ids."""
+    if not prompts_by_id:
+        return []
+    status.write(f"Submitting **{len(prompts_by_id)}** articles as a bulk job...")
+    try:
+        return [await submit_batch_job(prompts_by_id, sambanova_client)]
+    except Exception as e:
+        st.error(f"Error submitting SambaNova bulk job: {e}")
+        return []
+
+
+async def collect_batch_jobs(batch_ids, sambanova_client, status):
+    """Collects the bulk jobs concurrently, reporting any that fail."""
+    job_results = await asyncio.gather(*(
+        collect_batch_job(batch_id, sambanova_client, status) for batch_id in batch_ids),
+        return_exceptions=True)
+    for batch_id, job_result in zip(batch_ids, job_results):
+        if isinstance(job_result, Exception):
+            st.error(f"Error running SambaNova bulk job {batch_id}: {job_result}")
+
+
+async def analyze_companies_bulk(company_names, from_date, to_date, max_articles, keywords, allowed_domains, sambanova_client, status, keyword_pattern=CHURN_RE):
+    """
+    Analyzes all companies' articles in a single Batch API job instead of live requests.
+    Slower to complete but cheaper; articles with a cached analysis are not resubmitted, and
+    unfinished jobs from an interrupted run that cover this run's articles are resumed.
+    """
+    keyword_chunks = chunk_keywords(keywords, max_query_len=200)
+
+    # Prompts are keyed by their cache key, so the same article is submitted only once
+    articles_by_company = {}
+    prompts_by_id = {}
+    async with create_news_client() as news_client:
+        fetched_articles = await asyncio.gather(*(
+            fetch_news(company, from_date, to_date, max_articles,
+                       build_queries(company, keyword_chunks), allowed_domains, news_client)
+            for company in company_names))
+    status.write(f"Fetched news for **{len(company_names)}** companies")
+
+    for company, all_articles in zip(company_names, fetched_articles):
+        all_articles = all_articles or []
+        article_texts = [process_article(article) for article in all_articles]
+        prompt_keys = []
+        for article_text in article_texts:
+            if article_text and keyword_pattern.search(article_text):
+                prompt = USER_PROMPT_TMPL.format(provided_text=article_text)
+                cache_key = get_analysis_cache_key(prompt, ANALYSIS_MODEL, SYSTEM_PROMPT)
+                prompt_keys.append(cache_key)
+                if get_cached_analysis(cache_key) is None:
+                    prompts_by_id[cache_key] = prompt
+        articles_by_company[company] = (all_articles, article_texts, prompt_keys)
+
+    # Unfinished jobs from an interrupted run that cover this run's prompts are collected
+    # instead of being resubmitted; jobs covering none of them are left alone
+    bulk_job_store = get_bulk_job_store()
+    resumed_batch_ids = []
+    covered_prompts_by_id = {}
+    for batch_id in list(bulk_job_store):
+        covered_prompt_ids = prompts_by_id.keys() & set(bulk_job_store.get(batch_id) or ())
+        if not covered_prompt_ids:
+            continue
+        resumed_batch_ids.append(batch_id)
+        for cache_key in covered_prompt_ids:
+            covered_prompts_by_id[cache_key] = prompts_by_id.pop(cache_key)
+    if resumed_batch_ids:
+        status.write(f"Resuming **{len(resumed_batch_ids)}** unfinished bulk jobs...")
+
+    batch_ids = resumed_batch_ids + await submit_bulk_prompts(prompts_by_id, sambanova_client, status)
+    await collect_batch_jobs(batch_ids, sambanova_client, status)
+
+    # Prompts a resumed job did not answer, e.g. because it expired, are submitted again
+    retry_prompts_by_id = {cache_key: prompt for cache_key, prompt in covered_prompts_by_id.items()
+                           if get_cached_analysis(cache_key) is None}
+    await collect_batch_jobs(
+        await submit_bulk_prompts(retry_prompts_by_id, sambanova_client, status), sambanova_client, status)
+
+    semaphore = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+
+    async def summarize_company(company):
+        all_articles, article_texts, prompt_keys = articles_by_company[company]
+        if not all_articles:
+            return {"individual_analyses": [], "overall_summary": "No relevant news articles found for analysis."}
+        analysis_results = [parse_analysis(get_cached_analysis(cache_key) or "Analysis failed due to AI service error.")
+                            for cache_key in prompt_keys]
+        individual_analyses_list, combined_analysis_text_for_model = collect_individual_analyses(
+            company, all_articles, article_texts, analysis_results, keyword_pattern)
+        overall_summary_result = await summarize_analyses(
+            company, individual_analyses_list, combined_analysis_text_for_model, sambanova_client, semaphore)
+        return {"individual_analyses": individual_analyses_list, "overall_summary": overall_summary_result}
+
+    companies = list(articles_by_company)
+    company_analyses = await asyncio.gather(*(summarize_company(company) for company in companies))
+    return dict(zip(companies, company_analyses))
+
+
+def run_analysis(company_names, days_to_search, custom_keyword_string=None, bulk_mode=False):
+    """
+    Main function to orchestrate the news fetching and analysis for multiple companies.
+    In bulk mode articles are analyzed through the Batch API, which is cheaper but can take hours.
+    """
     today = datetime.today()
     # Use user-inputted days for the date range
     from_date = today - timedelta(days=days_to_search)
     max_articles_per_query = 10
 
-    # Get the SambaNova client before starting the loop
-    sambanova_client = get_sambanova_client()
-    if not sambanova_client:
+    # Check for the SambaNova API key before starting the analysis
+    sambanova_api_key = get_sambanova_api_key()
+    if not sambanova_api_key:
         return {}
         
-    # --- DEFAULT CHURN KEYWORDS ---
-    default_churn_keywords = {
-        "Corporate Restructuring": [
-            "merger", "acquisition", "investment", "joint venture", "IPO", "restructuring",
-            "realignment", "rebranding", "subsidiary", "consolidation"
-        ],
-        "Business Discontinuity": [
-            "shutdown", "closed", "bankruptcy", "insolvency", "pivot", "market exit"
-        ],
-        "Strategic Policy Changes": [
-            "benefits withdrawn", "benefits discontinued", "centralization",
-            "new CEO", "cost cutting", "budget cuts", "strategy shift"
-        ],
-        "Financial Constraints": [
-            "payroll issue", "financial loss", "cost pressure", "cash flow", "budget reallocation"
-        ],
-        "Employment Structure Changes": [
-            "employee transfer", "contractual workforce", "remote work",
-            "layoffs", "furloughs", "downsizing"
-        ],
-        "Regulatory & Compliance": [
-            "tax policy", "labor law", "income tax", "GST change", "budget amendment", "social security"
-        ],
-        "Competitive Market Dynamics": [
-            "switched vendor", "new platform", "competitor", "pricing", "market share",
-            "disruption", "value proposition"
-        ],
-        "Technological Transitions": [
-            "digital transformation", "HRMS integration", "API", "analytics",
-            "mobile app", "platform upgrade"
-        ],
-        "Service Delivery Issues": [
-            "onboarding delay", "tech issues", "merchant issue", "support problem",
-            "delivery delay", "reimbursement issue"
-        ],
-        "Employee Engagement": [
-            "low adoption", "user experience", "employee feedback",
-            "generation gap", "hybrid work", "usage drop"
-        ]
-    }
-
     # Process custom keywords from text area
     custom_keywords_flat_list = []
     if custom_keyword_string:
         # Split by comma and strip whitespace
         custom_keywords_flat_list = [
             kw.strip() for kw in custom_keyword_string.split(',') if kw.strip()]
-        # For simplification, we'll put all custom keywords into a single 'Custom' category
+        # Custom keywords replace the default keywords entirely
         if custom_keywords_flat_list:
-            churn_keywords_to_use = {"Custom": custom_keywords_flat_list}
+            keywords_to_use = tuple(custom_keywords_flat_list)
+            keyword_pattern = compile_keyword_pattern(custom_keywords_flat_list)
         else:
             # Fallback if string is empty after stripping
-            churn_keywords_to_use = default_churn_keywords
+            keywords_to_use = ALL_KEYWORDS
+            keyword_pattern = CHURN_RE
     else:
-        churn_keywords_to_use = default_churn_keywords
+        keywords_to_use = ALL_KEYWORDS
+        keyword_pattern = CHURN_RE
 
     # --- YOUR SPECIFIED ALLOWED DOMAINS (UNCHANGED) ---
     allowed_domains = [
@@ -315,8 +1092,8 @@ def run_analysis(company_names, days_to_search, custom_keyword_string=None):
         "zaubacorp.com", "tofler.in", "smestreet.in"
     ]
 
-    processed_allowed_domains = [domain.replace(
-        "www.", "") for domain in allowed_domains]
+    processed_allowed_domains = frozenset(
+        domain.lower().removeprefix("www.") for domain in allowed_domains)
 
     st.sidebar.subheader("Analysis Parameters")
     st.sidebar.info(
@@ -329,17 +1106,41 @@ def run_analysis(company_names, days_to_search, custom_keyword_string=None):
     else:
         st.sidebar.info("Using **default keywords** for search.")
 
-    for company in company_names:
-        queries = [company] + [f"{company} {keyword}" for category_keywords in churn_keywords_to_use.values()
-                               for keyword in category_keywords]
-        company_analysis = analyze_news(
-            company, from_date, today, max_articles_per_query, queries, processed_allowed_domains, sambanova_client
-        )
-        results[company] = company_analysis if company_analysis else {
-            "overall_summary": "Analysis failed."}
+    # Expanded while running so streamed analyses are visible, collapsed once done
+    status = st.status(
+        f"Analyzing {len(company_names)} companies...", expanded=True)
+    analyze = analyze_companies_bulk if bulk_mode else analyze_companies
+
+    async def analyze_with_client():
+        # The client's pooled connections belong to the event loop that opened them,
+        # so it is created and closed by the coroutine running the analysis
+        async with create_sambanova_client(sambanova_api_key) as sambanova_client:
+            return await analyze(
+                company_names, from_date, today, max_articles_per_query, keywords_to_use,
+                processed_allowed_domains, sambanova_client, status, keyword_pattern
+            )
+
+    # Each run gets its own event loop, so sessions analyze independently and any tasks
+    # left by an interrupted run are cancelled along with its loop
+    results = asyncio.run(analyze_with_client())
+    status.update(label=f"Analyzed {len(company_names)} companies.", state="complete", expanded=False)
     return results
 
 
+@st.cache_data
+def load_companies(file_bytes):
+    """
+    Reads company names from the 'CompanyName' column of an uploaded Excel file.
+    Cached on the file contents, so reruns with the same upload skip parsing.
+    Returns None if the file has no 'CompanyName' column.
+    """
+    company_df = pd.read_excel(
+        io.BytesIO(file_bytes), engine="calamine", usecols=lambda column: column == "CompanyName")
+    if "CompanyName" not in company_df.columns:
+        return None
+    return company_df["CompanyName"].dropna().tolist()
+
+
 # --- Streamlit App Layout ---
 st.set_page_config(page_title="Company Churn Risk Analyzer", layout="wide")
 st.title("💡 Company Churn Risk Analysis (India Focus)")
@@ -365,10 +1166,9 @@ uploaded_companies_file = st.file_uploader(
 company_names_from_upload = []
 if uploaded_companies_file is not None:
     try:
-        company_df = pd.read_excel(uploaded_companies_file)
-        if "CompanyName" in company_df.columns:
-            company_names_from_upload = company_df["CompanyName"].dropna(
-            ).tolist()
+        loaded_company_names = load_companies(uploaded_companies_file.getvalue())
+        if loaded_company_names is not None:
+            company_names_from_upload = loaded_company_names
             if company_names_from_upload:
                 st.success(
                     f"Successfully loaded **{len(company_names_from_upload)}** companies from **'{uploaded_companies_file.name}'**.")
@@ -417,49 +1217,20 @@ custom_keywords_input = st.text_area(
 st.markdown("---")
 st.subheader("Default Churn Keywords for Reference")
 with st.expander("Click to view default keywords"):
-    default_churn_keywords_display = {
-        "Corporate Restructuring": [
-            "merger", "acquisition", "investment", "joint venture", "IPO", "restructuring",
-            "realignment", "rebranding", "subsidiary", "consolidation"
-        ],
-        "Business Discontinuity": [
-            "shutdown", "closed", "bankruptcy", "insolvency", "pivot", "market exit"
-        ],
-        "Strategic Policy Changes": [
-            "benefits withdrawn", "benefits discontinued", "centralization",
-            "new CEO", "cost cutting", "budget cuts", "strategy shift"
-        ],
-        "Financial Constraints": [
-            "payroll issue", "financial loss", "cost pressure", "cash flow", "budget reallocation"
-        ],
-        "Employment Structure Changes": [
-            "employee transfer", "contractual workforce", "remote work",
-            "layoffs", "furloughs", "downsizing"
-        ],
-        "Regulatory & Compliance": [
-            "tax policy", "labor law", "income tax", "GST change", "budget amendment", "social security"
-        ],
-        "Competitive Market Dynamics": [
-            "switched vendor", "new platform", "competitor", "pricing", "market share",
-            "disruption", "value proposition"
-        ],
-        "Technological Transitions": [
-            "digital transformation", "HRMS integration", "API", "analytics",
-            "mobile app", "platform upgrade"
-        ],
-        "Service Delivery Issues": [
-            "onboarding delay", "tech issues", "merchant issue", "support problem",
-            "delivery delay", "reimbursement issue"
-        ],
-        "Employee Engagement": [
-            "low adoption", "user experience", "employee feedback",
-            "generation gap", "hybrid work", "usage drop"
-        ]
-    }
-    for category, keywords in default_churn_keywords_display.items():
+    for category, keywords in DEFAULT_CHURN_KEYWORDS.items():
         st.markdown(f"**{category}**: {', '.join(keywords)}")
 
 
+# Analysis mode
+st.markdown("---")
+analysis_mode = st.radio(
+    "Mode",
+    ["Interactive", "Bulk (cheaper, slower)"],
+    horizontal=True,
+    help="Bulk mode submits all articles as one SambaNova batch job. It costs less but can take up to 24 hours, so use it for large uploads."
+)
+
+
 if st.button("🚀 Start Analysis"):
     if not company_names_to_analyze:
         st.warning(
@@ -467,7 +1238,8 @@ if st.button("🚀 Start Analysis"):
     else:
         with st.spinner("Crunching numbers and fetching news... This might take a while for each company."):
             analysis_results = run_analysis(
-                company_names_to_analyze, days_to_search, custom_keywords_input)  # Pass custom keywords input
+                company_names_to_analyze, days_to_search, custom_keywords_input,  # Pass custom keywords input
+                bulk_mode=analysis_mode.startswith("Bulk"))
 
         st.success("🎉 Analysis Complete!")
         st.markdown("---")
@@ -488,12 +1260,13 @@ if st.button("🚀 Start Analysis"):
                         f"#### :newspaper: {article_analysis['title']}")
                     st.markdown(f"**URL:** [Link]({article_analysis['url']})")
                     article_analysis_text = article_analysis['analysis']
+                    article_risk_level = get_risk_level(article_analysis_text)
                     # Color-code individual analysis
-                    if "High Risk" in article_analysis_text:
+                    if "High Risk" in article_risk_level:
                         st.error(f"**Analysis:** {article_analysis_text}")
-                    elif "Medium Risk" in article_analysis_text:
+                    elif "Medium Risk" in article_risk_level:
                         st.warning(f"**Analysis:** {article_analysis_text}")
-                    elif "Low Risk" in article_analysis_text:
+                    elif "Low Risk" in article_risk_level:
                         st.info(f"**Analysis:** {article_analysis_text}")
                     else:
                         st.write(f"**Analysis:** {article_analysis_text}")
@@ -503,37 +1276,14 @@ if st.button("🚀 Start Analysis"):
             st.markdown("---")  # Separator between companies
 
         # Export to Excel
-        data_for_df = []
-        for company, analysis in analysis_results.items():
-            overall_summary = analysis.get(
-                "overall_summary", "No analysis available")
-            overall_risk_level = get_risk_level(
-                overall_summary)  # Get overall risk level
-
-            company_data = {
-                "Company": company,
-                "Overall Risk Level": overall_risk_level,  # New column for risk level
-                "Overall Summary": overall_summary
-            }
-            for i, article_analysis in enumerate(analysis.get("individual_analyses", [])):
-                # Get individual article risk level
-                article_risk_level = get_risk_level(
-                    article_analysis["analysis"])
-                company_data[f"Article {i+1} Title"] = article_analysis["title"]
-                company_data[f"Article {i+1} URL"] = article_analysis["url"]
-                # Add risk level for individual article
-                company_data[f"Article {i+1} Risk Level"] = article_risk_level
-                company_data[f"Article {i+1} Analysis"] = article_analysis["analysis"]
-            data_for_df.append(company_data)
+        data_for_df = build_export_records(analysis_results)
 
         if data_for_df:
-            df_results = pd.DataFrame(data_for_df)
+            df_results = pd.DataFrame.from_records(data_for_df, columns=EXPORT_COLUMNS)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             excel_file_name = f"churn_analysis_results_{timestamp}.xlsx"
 
-            excel_buffer = io.BytesIO()
-            df_results.to_excel(excel_buffer, index=False, engine='xlsxwriter')
-            excel_buffer.seek(0)
+            excel_buffer = write_results_excel(df_results)
 
             st.download_button(
                 label="Download All Results as Excel 📊",